@@ -10,8 +10,9 @@ import sys
 import os
 import io
 import json
+import threading
 import requests
-from PyQt6.QtCore import QUrl, QObject, pyqtSlot, QSize, pyqtProperty, QRect, pyqtSignal, Qt, QSizeF
+from PyQt6.QtCore import QUrl, QObject, QThread, pyqtSlot, QSize, pyqtProperty, QRect, pyqtSignal, Qt, QSizeF
 from PyQt6.QtGui import QGuiApplication, QImage, QPainter, QPageSize, QPageLayout, QPen, QColor
 from PyQt6.QtQml import QQmlApplicationEngine
 from PyQt6.QtQuick import QQuickImageProvider
@@ -20,6 +21,169 @@ import cv2
 import numpy as np
 from PIL import Image
 
+class RenderThread(QThread):
+    """Hilo de render: ejecuta el pipeline de imagen y publica el resultado
+    en uno de dos buffers preasignados (doble buffer).
+
+    El hilo GUI solo envía trabajos (submit) y lee el buffer frontal
+    publicado; nunca ve un frame escrito a medias."""
+    frameReady = pyqtSignal()
+
+    def __init__(self):
+        super().__init__()
+        self._cond = threading.Condition()  # protege _pending, _busy y _running
+        self._pending = None
+        self._busy = False
+        self._running = True
+        self._front_lock = threading.Lock()  # protege _front
+        self._buffers = [None, None]
+        self._front = None
+        # Caché de la composición fondo removido + color
+        self._composite_src = None
+        self._composite_key = None
+        self._composite = None
+
+    def submit(self, job):
+        """Encola un trabajo; si había uno pendiente se reemplaza por el más reciente"""
+        with self._cond:
+            self._pending = job
+            self._cond.notify_all()
+
+    def stop(self):
+        with self._cond:
+            self._running = False
+            self._cond.notify_all()
+        self.wait()
+
+    def waitIdle(self, timeout=None):
+        """Bloquea hasta que no queden trabajos pendientes ni en curso"""
+        with self._cond:
+            return self._cond.wait_for(
+                lambda: (self._pending is None and not self._busy) or not self._running,
+                timeout)
+
+    def run(self):
+        while True:
+            with self._cond:
+                while self._pending is None and self._running:
+                    self._cond.wait()
+                if not self._running:
+                    return
+                job, self._pending = self._pending, None
+                self._busy = True
+            try:
+                self._publish(self._render(job))
+                self.frameReady.emit()
+            except Exception as e:
+                print(f"Error render: {str(e)}")
+            finally:
+                with self._cond:
+                    self._busy = False
+                    self._cond.notify_all()
+
+    def _publish(self, img):
+        """Escribe en el buffer trasero y lo publica de forma atómica"""
+        back = 0 if self._front is None else 1 - self._front
+        buf = self._buffers[back]
+        if buf is None or buf.shape != img.shape:
+            buf = self._buffers[back] = np.empty(img.shape, dtype=np.uint8)
+        np.copyto(buf, img)
+        # Los lectores copian bajo _front_lock, así que tras el intercambio
+        # nadie sigue leyendo el buffer que pasa a ser el trasero.
+        with self._front_lock:
+            self._front = back
+
+    def hasFrame(self):
+        with self._front_lock:
+            return self._front is not None
+
+    def frameQImage(self):
+        """QImage (copia profunda) del buffer frontal publicado (o None)"""
+        with self._front_lock:
+            if self._front is None:
+                return None
+            buf = self._buffers[self._front]
+            h, w = buf.shape[:2]
+            return QImage(buf.data, w, h, 3*w, QImage.Format.Format_RGB888).rgbSwapped()
+
+    def _compositeBackground(self, cutout, mask, bgr_color):
+        if cutout is self._composite_src and self._composite_key == bgr_color:
+            return self._composite
+
+        result = np.full_like(cutout, bgr_color)
+        mask_3 = np.stack([mask, mask, mask], axis=-1)
+        result = (cutout * mask_3 + result * (1 - mask_3)).astype(np.uint8)
+
+        self._composite_src = cutout
+        self._composite_key = bgr_color
+        self._composite = result
+        return result
+
+    def _render(self, job):
+        """Pipeline central de procesamiento de imagen"""
+        if job.get("raw"):
+            return job["source"]
+
+        # Obtener color de fondo para composición y relleno de huecos
+        hex_color = job["background_color"].lstrip('#')
+        rgb = tuple(int(hex_color[i:i+2], 16) for i in (0, 2, 4))
+        bgr_color = (rgb[2], rgb[1], rgb[0])
+
+        # 1. Empezar desde la imagen base centrada (con o sin fondo removido)
+        if job["cutout"] is not None and job["mask"] is not None:
+            img = self._compositeBackground(job["cutout"], job["mask"], bgr_color)
+        else:
+            img = job["source"]
+        rows, cols, _ = img.shape
+
+        # 2. Aplicar Desplazamiento Vertical Manual
+        shift = int(job["vertical_shift"])
+        if shift != 0:
+            shifted_img = np.full_like(img, bgr_color)
+            
+            if shift > 0: # Mover imagen hacia abajo (rellenar arriba)
+                # Asegurarse de no salir de los límites
+                copy_height = rows - shift
+                if copy_height > 0:
+                    shifted_img[shift:, :] = img[:copy_height, :]
+            else: # Mover imagen hacia arriba (rellenar abajo)
+                copy_height = rows + shift # shift es negativo
+                if copy_height > 0:
+                    shifted_img[:copy_height, :] = img[-shift:, :]
+            
+            img = shifted_img
+
+        # 3. Aplicar Ajustes de Color (Brillo/Contraste)
+        brightness = job["brightness"]
+        contrast = job["contrast"] / 100.0
+        
+        if brightness != 0 or contrast != 0:
+            img = cv2.convertScaleAbs(img, alpha=1 + contrast, beta=brightness)
+        
+        # 4. Aplicar Saturación
+        if job["saturation"] != 0:
+            hsv = cv2.cvtColor(img, cv2.COLOR_BGR2HSV).astype(np.float32)
+            saturation_scale = 1 + (job["saturation"] / 100.0)
+            hsv[:, :, 1] = np.clip(hsv[:, :, 1] * saturation_scale, 0, 255)
+            img = cv2.cvtColor(hsv.astype(np.uint8), cv2.COLOR_HSV2BGR)
+
+        # 5. Aplicar Recorte para Datos Personales
+        if job["personal_data"]:
+            # La lógica original: desplazar hacia arriba cortando la parte superior
+            # para dejar espacio negro abajo (que es parte del fondo del control QML o añadido aquí)
+            # Nota: El código original creaba una imagen negra y pegaba la foto desplazada hacia arriba.
+            shift_pixels = int(rows * job["personal_data_ratio"] / 3.44)
+            
+            result_with_data = np.zeros_like(img) # Fondo negro por defecto
+            
+            # Copiar la imagen desplazada hacia arriba
+            if shift_pixels < rows:
+                result_with_data[:-shift_pixels, :] = img[shift_pixels:, :]
+            
+            img = result_with_data
+
+        return img
+
 class ImageProcessor(QObject):
     nameChanged = pyqtSignal()
     lastnameChanged = pyqtSignal()
@@ -36,7 +200,6 @@ class ImageProcessor(QObject):
 
     def __init__(self):
         super().__init__()
-        self.image = None
         self.original_image = None
         self.centered_image = None
         self.centered_original = None
@@ -63,6 +226,15 @@ class ImageProcessor(QObject):
         
         self.load_config()
 
+        # Todo el trabajo de píxeles corre en un hilo dedicado
+        self.renderer = RenderThread()
+        self.renderer.frameReady.connect(self.imageChanged)
+        self.renderer.start()
+
+    @pyqtSlot()
+    def shutdown(self):
+        self.renderer.stop()
+
     def load_config(self):
         config_path = os.path.join(os.path.dirname(__file__), "config.json")
         default_config = {
@@ -103,8 +275,8 @@ class ImageProcessor(QObject):
     def loadImage(self, file_url):
         file_path = QUrl(file_url).toLocalFile()
         self.original_image = cv2.imread(file_path)
-        self.image = self.original_image.copy()
-        self.imageChanged.emit()
+        if self.original_image is not None:
+            self.renderer.submit({"source": self.original_image, "raw": True})
         self._isCentered = False
         self.isCenteredChanged.emit()
         self.background_removed_image = None
@@ -113,7 +285,7 @@ class ImageProcessor(QObject):
         self._contrast = 0
         self._saturation = 0
         self._manual_vertical_shift = 0 # Resetear shift
-        return self.image is not None
+        return self.original_image is not None
 
     def detect_face(self, image):
         gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
@@ -191,67 +363,24 @@ class ImageProcessor(QObject):
         self._updateFinalImage()
 
     def _updateFinalImage(self):
-        """Pipeline central de procesamiento de imagen"""
+        """Envía al hilo de render una instantánea de los parámetros actuales"""
         if self.centered_image is None:
             return
 
-        # 1. Empezar desde la imagen base centrada (con o sin fondo removido)
-        img = self.centered_image.copy()
-        rows, cols, _ = img.shape
-
-        # 2. Aplicar Desplazamiento Vertical Manual
-        shift = int(self._manual_vertical_shift)
-        if shift != 0:
-            # Obtener color de fondo para rellenar huecos
-            hex_color = self._backgroundColor.lstrip('#')
-            rgb = tuple(int(hex_color[i:i+2], 16) for i in (0, 2, 4))
-            bgr_color = (rgb[2], rgb[1], rgb[0])
-            
-            shifted_img = np.full_like(img, bgr_color)
-            
-            if shift > 0: # Mover imagen hacia abajo (rellenar arriba)
-                # Asegurarse de no salir de los límites
-                copy_height = rows - shift
-                if copy_height > 0:
-                    shifted_img[shift:, :] = img[:copy_height, :]
-            else: # Mover imagen hacia arriba (rellenar abajo)
-                copy_height = rows + shift # shift es negativo
-                if copy_height > 0:
-                    shifted_img[:copy_height, :] = img[-shift:, :]
-            
-            img = shifted_img
-
-        # 3. Aplicar Ajustes de Color (Brillo/Contraste)
-        brightness = self._brightness
-        contrast = self._contrast / 100.0
-        
-        if brightness != 0 or contrast != 0:
-            img = cv2.convertScaleAbs(img, alpha=1 + contrast, beta=brightness)
-        
-        # 4. Aplicar Saturación
-        if self._saturation != 0:
-            hsv = cv2.cvtColor(img, cv2.COLOR_BGR2HSV).astype(np.float32)
-            saturation_scale = 1 + (self._saturation / 100.0)
-            hsv[:, :, 1] = np.clip(hsv[:, :, 1] * saturation_scale, 0, 255)
-            img = cv2.cvtColor(hsv.astype(np.uint8), cv2.COLOR_HSV2BGR)
-
-        # 5. Aplicar Recorte para Datos Personales
-        if self._isShowingPersonalData:
-            # La lógica original: desplazar hacia arriba cortando la parte superior
-            # para dejar espacio negro abajo (que es parte del fondo del control QML o añadido aquí)
-            # Nota: El código original creaba una imagen negra y pegaba la foto desplazada hacia arriba.
-            shift_pixels = int(rows * self._personalDataRatio / 3.44)
-            
-            result_with_data = np.zeros_like(img) # Fondo negro por defecto
-            
-            # Copiar la imagen desplazada hacia arriba
-            if shift_pixels < rows:
-                result_with_data[:-shift_pixels, :] = img[shift_pixels:, :]
-            
-            img = result_with_data
-
-        self.image = img
-        self.imageChanged.emit()
+        # Las matrices se comparten por referencia: el hilo GUI nunca las modifica
+        # en sitio, solo las reemplaza, así que la instantánea es consistente.
+        self.renderer.submit({
+            "source": self.centered_image,
+            "cutout": self.background_removed_image,
+            "mask": self.mask,
+            "background_color": self._backgroundColor,
+            "vertical_shift": self._manual_vertical_shift,
+            "brightness": self._brightness,
+            "contrast": self._contrast,
+            "saturation": self._saturation,
+            "personal_data": self._isShowingPersonalData,
+            "personal_data_ratio": self._personalDataRatio,
+        })
 
     @pyqtSlot(result=bool)
     def removeBackgroundWithPhotoRoom(self):
@@ -294,17 +423,7 @@ class ImageProcessor(QObject):
     def applyBackgroundColor(self):
         if self.background_removed_image is None or self.mask is None:
             return
-        
-        hex_color = self._backgroundColor.lstrip('#')
-        rgb = tuple(int(hex_color[i:i+2], 16) for i in (0, 2, 4))
-        bgr_color = (rgb[2], rgb[1], rgb[0])
-        
-        result = np.full_like(self.background_removed_image, bgr_color)
-        
-        mask_3 = np.stack([self.mask, self.mask, self.mask], axis=-1)
-        result = (self.background_removed_image * mask_3 + result * (1 - mask_3)).astype(np.uint8)
-        
-        self.centered_image = result
+        # La composición con el color de fondo se hace en el hilo de render
         self._updateFinalImage()
 
     @pyqtSlot()
@@ -319,7 +438,7 @@ class ImageProcessor(QObject):
 
     @pyqtSlot(float, float, result=bool)
     def adjustPrintLayout(self, canvas_width, canvas_height):
-        if self.image is None or not self._isCentered or not self.current_photo_size:
+        if not self.renderer.hasFrame() or not self._isCentered or not self.current_photo_size:
             return False
 
         PAPER_WIDTH_MM = self.app_settings.get("paper_width_mm", 152)
@@ -419,7 +538,9 @@ class ImageProcessor(QObject):
 
     @pyqtSlot()
     def printImage(self):
-        if self.image is None or self.current_printer is None or not self.print_layout: return
+        # Esperar a que el último ajuste aplicado esté publicado
+        self.renderer.waitIdle()
+        if not self.renderer.hasFrame() or self.current_printer is None or not self.print_layout: return
 
         printer = QPrinter(self.current_printer)
         printer.setResolution(self.app_settings.get("default_dpi", 300))
@@ -432,7 +553,10 @@ class ImageProcessor(QObject):
         painter = QPainter()
         if not painter.begin(printer): return
 
-        qimage = self.cv_to_qimage(self.image)
+        qimage = self.renderer.frameQImage()
+        if qimage is None:
+            painter.end()
+            return
 
         # Dibujar guías
         if self._showCutGuides:
@@ -471,10 +595,6 @@ class ImageProcessor(QObject):
 
         painter.end()
 
-    def cv_to_qimage(self, cv_img):
-        h, w, c = cv_img.shape
-        return QImage(cv_img.data, w, h, 3*w, QImage.Format.Format_RGB888).rgbSwapped()
-
     # Propiedades
     @pyqtProperty(str, notify=nameChanged)
     def name(self): return self._name
@@ -538,18 +658,21 @@ class ImageProvider(QQuickImageProvider):
                 qimg = QImage(img.data, w, h, (4 if img.shape[2]==4 else 3)*w, fmt).rgbSwapped()
                 return qimg, qimg.size()
             except: return QImage(), QSize()
-        elif self.processor.image is None:
-            return QImage(), QSize()
         else:
-            h, w = self.processor.image.shape[:2]
-            return QImage(self.processor.image.data, w, h, 3*w, QImage.Format.Format_RGB888).rgbSwapped(), QSize(w, h)
+            qimg = self.processor.renderer.frameQImage()
+            if qimg is None: return QImage(), QSize()
+            return qimg, qimg.size()
 
 if __name__ == "__main__":
     app = QGuiApplication(sys.argv)
     engine = QQmlApplicationEngine()
     proc = ImageProcessor()
-    engine.rootContext().setContextProperty("imageProcessor", proc)
-    engine.addImageProvider("live", ImageProvider(proc))
-    engine.load(QUrl.fromLocalFile(os.path.join(os.path.dirname(__file__), "main.qml")))
-    if not engine.rootObjects(): sys.exit(-1)
-    sys.exit(app.exec())
\ No newline at end of file
+    try:
+        engine.rootContext().setContextProperty("imageProcessor", proc)
+        engine.addImageProvider("live", ImageProvider(proc))
+        engine.load(QUrl.fromLocalFile(os.path.join(os.path.dirname(__file__), "main.qml")))
+        if not engine.rootObjects(): sys.exit(-1)
+        sys.exit(app.exec())
+    finally:
+        # Detener el hilo de render en toda salida, incluida la temprana
+        proc.shutdown()
\ No newline at end of file
@@ -17,12 +17,8 @@ ApplicationWindow {
         id: fileDialog
         title: "Seleccionar fotografia"
         nameFilters: ["Archivos de imagen (*.jpg *.png *.bmp)"]
-        onAccepted: {
-            if (imageProcessor.loadImage(fileDialog.selectedFile)) {
-                imageView.source = ""
-                imageView.source = "image://live/image"
-            }
-        }
+        // La vista se recarga en onImageChanged cuando el frame está publicado
+        onAccepted: imageProcessor.loadImage(fileDialog.selectedFile)
     }
 
     RowLayout {